@@ -1,5 +1,5 @@
 import io
-import time
+import re
 
 import numpy as np
 import pandas as pd
@@ -11,16 +11,29 @@ st.set_page_config(page_title="Pile Capacity Calculator", layout="wide")
 
 
 # --- Initialize Session State ---
+def units_frame():
+    """
+    DataFrame of the current units, used as the unit editor's input. It is only
+    rebuilt when the editor has to show units it did not enter itself.
+    """
+    return pd.DataFrame(
+        {
+            "name": st.session_state.unit_names,
+            "top_depth": st.session_state.unit_tops,
+            "skin_friction": st.session_state.unit_sfs,
+            "end_bearing": st.session_state.unit_ebs,
+        }
+    )
+
+
 def initialize_session_state():
-    if "units" not in st.session_state:
-        st.session_state.units = [
-            {
-                "name": "Unit 1",
-                "top_depth": 0.0,
-                "skin_friction": 0.0,
-                "end_bearing": 0.0,
-            }
-        ]
+    # Geological units are stored as parallel arrays, one entry per unit
+    if "unit_names" not in st.session_state:
+        st.session_state.unit_names = ["Unit 1"]
+        st.session_state.unit_tops = np.array([0.0])
+        st.session_state.unit_sfs = np.array([0.0])
+        st.session_state.unit_ebs = np.array([0.0])
+        st.session_state.units_df = units_frame()
     # Initialize other parameters
     if "diameter_min" not in st.session_state:
         st.session_state.diameter_min = 0.3
@@ -36,60 +49,109 @@ def initialize_session_state():
         st.session_state.three_d_embed = False
     if "skin_friction_only" not in st.session_state:
         st.session_state.skin_friction_only = False
+    if "loaded_file_id" not in st.session_state:
+        st.session_state.loaded_file_id = None
+    if "units_editor_version" not in st.session_state:
+        st.session_state.units_editor_version = 0
 
 
 initialize_session_state()
 
 
 # --- Helper Functions ---
+PARAMETER_KEYS = [
+    "diameter_min",
+    "diameter_max",
+    "length_min",
+    "length_max",
+    "reduction_factor",
+    "three_d_embed",
+    "skin_friction_only",
+]
+UNIT_COLUMNS = ["name", "top_depth", "skin_friction", "end_bearing"]
+
+
 def rename_units():
     """Ensure units are always sequentially named."""
-    for i, u in enumerate(st.session_state.units, start=1):
-        u["name"] = f"Unit {i}"
+    st.session_state.unit_names = [
+        f"Unit {i}" for i in range(1, len(st.session_state.unit_names) + 1)
+    ]
+
+
+def reset_units_editor():
+    """Show the current units in a new unit editor, dropping its pending edits."""
+    st.session_state.units_df = units_frame()
+    st.session_state.units_editor_version += 1
+
+
+def units_fingerprint():
+    """Content hash of the units, including the names used in the CSV export."""
+    return hash(
+        (tuple(st.session_state.unit_names),)
+        + tuple(
+            st.session_state[key].tobytes()
+            for key in ("unit_tops", "unit_sfs", "unit_ebs")
+        )
+    )
 
 
 def load_csv(file):
     """Load parameters and units from uploaded CSV file into session state."""
     try:
-        # Read the entire file as text
+        # Read the file once and split it at the blank line between the
+        # parameters table and the units table
         file.seek(0)
-        content = file.read().decode("utf-8")
-        lines = content.splitlines()
+        content = file.read()
+        blocks = re.split(rb"(?:^|\r?\n)[ \t]*\r?\n", content, maxsplit=1)
+        params_bytes = blocks[0]
+        units_bytes = blocks[1] if len(blocks) > 1 else b""
 
-        # Separate parameters and units
+        # Parameters: one "key,value" row each
         params = {}
-        units = []
-        mode = "parameters"  # Start with parameters
-        skip_next_line = False  # To skip the units header
-
-        for line in lines:
-            if line.strip() == "":
-                mode = "units"
-                skip_next_line = True  # Next line is header, skip it
-                continue
-            if mode == "parameters":
-                if "," in line:
-                    key, value = line.split(",", 1)
-                    params[key.strip()] = value.strip()
-            elif mode == "units":
-                if skip_next_line:
-                    # Skip the units header
-                    skip_next_line = False
-                    continue
-                parts = line.split(",")
-                if len(parts) == 4:
-                    name, top_depth, skin_friction, end_bearing = parts
-                    try:
-                        units.append(
-                            {
-                                "name": name.strip(),
-                                "top_depth": float(top_depth.strip()),
-                                "skin_friction": float(skin_friction.strip()),
-                                "end_bearing": float(end_bearing.strip()),
-                            }
-                        )
-                    except ValueError as ve:
-                        st.warning(f"Skipping unit due to conversion error: {ve}")
+        if params_bytes.strip():
+            params_df = pd.read_csv(
+                io.BytesIO(params_bytes),
+                names=["key", "value"],
+                header=None,
+                dtype=str,
+                skipinitialspace=True,
+            ).dropna()
+            params = dict(
+                zip(params_df["key"].str.strip(), params_df["value"].str.strip())
+            )
+
+        # Units: header row followed by one row per unit. Blank lines ahead
+        # of the header are skipped so the header row is always dropped
+        units_bytes = units_bytes.lstrip()
+        units_df = pd.DataFrame(columns=UNIT_COLUMNS, dtype=str)
+        if units_bytes:
+            # Close every line with an end marker field. Rows with missing
+            # fields do not have it in the marker column and rows with extra
+            # fields are bad lines, so both are skipped silently
+            units_bytes = re.sub(rb"\r?\n", b",<end>\n", units_bytes) + b",<end>"
+            units_df = pd.read_csv(
+                io.BytesIO(units_bytes),
+                names=UNIT_COLUMNS + ["end"],
+                header=0,
+                dtype=str,
+                keep_default_na=False,
+                on_bad_lines="skip",
+            )
+            units_df = units_df.loc[units_df["end"] == "<end>", UNIT_COLUMNS].apply(
+                lambda column: column.str.strip()
+            )
+        raw_values = units_df[UNIT_COLUMNS[1:]]
+        values = raw_values.apply(pd.to_numeric, errors="coerce")
+        invalid = values.isna().any(axis=1)
+        # Report the first value of each row that failed to convert
+        first_bad = raw_values.where(values.isna()).bfill(axis=1).iloc[:, 0]
+        for value in first_bad[invalid]:
+            st.warning(
+                "Skipping unit due to conversion error: "
+                f"could not convert string to float: {value!r}"
+            )
+        units_df = units_df[~invalid]
+        values = values[~invalid]
 
         # Update parameters
         if "diameter_min" in params:
@@ -112,9 +174,13 @@ def load_csv(file):
             )
 
         # Update units
-        if units:
-            st.session_state.units = units
+        if len(units_df):
+            st.session_state.unit_names = units_df["name"].tolist()
+            st.session_state.unit_tops = values["top_depth"].to_numpy(dtype=float)
+            st.session_state.unit_sfs = values["skin_friction"].to_numpy(dtype=float)
+            st.session_state.unit_ebs = values["end_bearing"].to_numpy(dtype=float)
             rename_units()
+            reset_units_editor()
         else:
             st.warning("No geological units found in the uploaded CSV.")
 
@@ -122,30 +188,28 @@ def load_csv(file):
         st.error(f"Failed to load CSV: {e}")
 
 
-def generate_csv():
-    """Generate CSV of current parameters and units."""
-    output = io.StringIO()
-    # Write parameters
-    output.write("parameter,value\n")
-    output.write(f"diameter_min,{st.session_state.diameter_min}\n")
-    output.write(f"diameter_max,{st.session_state.diameter_max}\n")
-    output.write(f"length_min,{st.session_state.length_min}\n")
-    output.write(f"length_max,{st.session_state.length_max}\n")
-    output.write(f"reduction_factor,{st.session_state.reduction_factor}\n")
-    output.write(f"three_d_embed,{st.session_state.three_d_embed}\n")
-    output.write(f"skin_friction_only,{st.session_state.skin_friction_only}\n\n")
-
-    # Write units
-    output.write("name,top_depth,skin_friction,end_bearing\n")
-    for u in st.session_state.units:
-        output.write(
-            f"{u['name']},{u['top_depth']},{u['skin_friction']},{u['end_bearing']}\n"
-        )
-
-    return output.getvalue()
+@st.cache_data(max_entries=32)
+def generate_csv(params, unit_names, unit_tops, unit_sfs, unit_ebs):
+    """Generate CSV of the given (parameter, value) pairs and units."""
+    params_df = pd.DataFrame(params, columns=["parameter", "value"])
+    units_df = pd.DataFrame(
+        {
+            "name": unit_names,
+            "top_depth": unit_tops,
+            "skin_friction": unit_sfs,
+            "end_bearing": unit_ebs,
+        },
+        columns=UNIT_COLUMNS,
+    )
+    return (
+        params_df.to_csv(index=False, lineterminator="\n")
+        + "\n"
+        + units_df.to_csv(index=False, lineterminator="\n")
+    )
 
 
-def calculate_3d_embedment_eb(toe_depth, diameter, sorted_units):
+@st.cache_data(max_entries=256)
+def calculate_3d_embedment_profile(diameter, units_key):
     """
     Calculate the effective end bearing considering 3D embedment rules and transitions.
     Rules:
@@ -161,145 +225,174 @@ def calculate_3d_embedment_eb(toe_depth, diameter, sorted_units):
          - For the first 3D within Unit B: use 0
          - After 3D: use EB_B
 
-    3. If three_d_embed is False, simply take the end bearing of the unit where the toe lies.
+    For a fixed diameter this depends only on the unit holding the toe and on
+    whether the toe is 3D into it, so it is returned as a lookup table: for each
+    unit (sorted by top depth), the effective EB while the toe is within its
+    first 3D. Once the toe is embedded at least 3D, the unit's own EB applies.
+
+    units_key is a tuple of (top_depth, bottom_depth, end_bearing) per sorted
+    unit so that profiles are cached per (diameter, units) across reruns.
     """
     embed_length = 3 * diameter
     previous_EB = 0.0
-    current_EB = 0.0
+    partial_EB = []
 
-    for i, unit in enumerate(sorted_units):
-        unit_top = unit["top_depth"]
-        unit_EB = unit["end_bearing"]
-        if i < len(sorted_units) - 1:
-            unit_bottom = sorted_units[i + 1]["top_depth"]
+    for unit_top, unit_bottom, unit_EB in units_key:
+        # Toe within the first 3D of this unit
+        if unit_EB > previous_EB and unit_EB > 0:
+            partial_EB.append(previous_EB)
         else:
-            unit_bottom = float("inf")
-
-        if toe_depth < unit_top:
-            # Toe is above this unit
-            break
-
-        if toe_depth >= unit_top and toe_depth < unit_bottom:
-            # Toe is within this unit
-            embed_depth = toe_depth - unit_top
-            if embed_depth < embed_length:
-                if unit_EB > previous_EB and unit_EB > 0:
-                    effective_EB = previous_EB
-                else:
-                    effective_EB = 0.0
-            else:
-                if unit_EB > previous_EB and unit_EB > 0:
-                    effective_EB = unit_EB
-                else:
-                    effective_EB = unit_EB
-            return effective_EB
-        elif toe_depth >= unit_bottom:
-            # Toe is below this unit, check if 3D embedment was achieved
-            embed_in_unit = unit_bottom - unit_top
-            if embed_in_unit >= embed_length:
-                if unit_EB > previous_EB and unit_EB > 0:
-                    previous_EB = unit_EB
-                else:
-                    previous_EB = unit_EB
-            else:
-                if unit_EB > previous_EB and unit_EB > 0:
-                    if embed_in_unit >= embed_length:
-                        previous_EB = unit_EB
-                    else:
-                        # Not enough embedment, keep previous_EB
-                        pass
-                else:
-                    previous_EB = unit_EB
-    # If toe_depth exceeds all unit bottoms
-    return previous_EB
+            partial_EB.append(0.0)
 
+        # Toe below this unit, check if 3D embedment was achieved
+        embed_in_unit = unit_bottom - unit_top
+        if embed_in_unit >= embed_length:
+            previous_EB = unit_EB
+        elif not (unit_EB > previous_EB and unit_EB > 0):
+            previous_EB = unit_EB
+        # Otherwise not enough embedment, keep previous_EB
 
-def calculate_capacity(
-    diameter, length, units, reduction_factor, three_d_embed, skin_friction_only
-):
+    return tuple(partial_EB)
+
+
+def prepare_units(tops, skin_frictions, end_bearings):
     """
-    Calculate the pile capacity (in kN).
+    Sort units by top depth, add a dummy unit from the surface if the first unit
+    starts below it and derive each unit's bottom depth. Units are given as
+    parallel arrays of top depth (m), skin friction (kPa) and end bearing (kPa).
+    Returns (tops, bottoms, skin_frictions, end_bearings).
     """
-    area_base = np.pi * (diameter / 2) ** 2  # m²
-    perimeter = np.pi * diameter  # m
-
     # Sort units by top_depth
-    sorted_units = sorted(units, key=lambda u: u["top_depth"])
-    if sorted_units and sorted_units[0]["top_depth"] > 0:
-        sorted_units.insert(
-            0,
-            {
-                "name": "Dummy",
-                "top_depth": 0.0,
-                "skin_friction": 0.0,
-                "end_bearing": 0.0,
-            },
-        )
+    order = np.argsort(tops, kind="stable")
+    tops = np.asarray(tops, dtype=float)[order]
+    skin_frictions = np.asarray(skin_frictions, dtype=float)[order]
+    end_bearings = np.asarray(end_bearings, dtype=float)[order]
+    if tops.size and tops[0] > 0:
+        # Dummy unit from the surface down to the first unit
+        tops = np.concatenate(([0.0], tops))
+        skin_frictions = np.concatenate(([0.0], skin_frictions))
+        end_bearings = np.concatenate(([0.0], end_bearings))
+    bottoms = np.append(tops[1:], np.inf) if tops.size else tops
+    return tops, bottoms, skin_frictions, end_bearings
 
-    for i in range(len(sorted_units)):
-        if i < len(sorted_units) - 1:
-            sorted_units[i]["bottom_depth"] = sorted_units[i + 1]["top_depth"]
-        else:
-            sorted_units[i]["bottom_depth"] = float("inf")
 
-    # Skin friction
+def calculate_capacity(
+    diameters,
+    lengths,
+    prepared_units,
+    reduction_factor,
+    three_d_embed,
+    skin_friction_only,
+):
+    """
+    Calculate the pile capacity (in kN) for every diameter/length combination.
+    prepared_units is the output of prepare_units, computed once per set of
+    units. Returns an array of shape (len(diameters), len(lengths)).
+    If three_d_embed is False, the end bearing is simply that of the unit
+    where the toe lies.
+    """
+    diameters = np.asarray(diameters, dtype=float)
+    lengths = np.asarray(lengths, dtype=float)
+    area_base = np.pi * (diameters / 2) ** 2  # m²
+    perimeter = np.pi * diameters  # m
+
+    tops, bottoms, skin_frictions, end_bearings = prepared_units
+    if tops.size == 0:
+        return np.zeros((diameters.size, lengths.size))
+
+    # Skin friction per unit perimeter: every full 0.5 m segment contributes
+    # sf * 0.5 through a cumulative sum shared by all lengths, and only the
+    # final partial segment of each length is added separately
     increment = 0.5  # meters
-    segments = int(np.ceil(length / increment))
-    total_friction = 0.0
-    for seg in range(segments):
-        seg_top = seg * increment
-        seg_bot = min((seg + 1) * increment, length)
-        seg_mid = (seg_top + seg_bot) / 2
-        seg_len = seg_bot - seg_top
-
-        current_unit = None
-        for unit in sorted_units:
-            if unit["top_depth"] <= seg_mid < unit["bottom_depth"]:
-                current_unit = unit
-                break
-        if current_unit:
-            sf = current_unit["skin_friction"]
-            seg_friction = sf * perimeter * seg_len
-            total_friction += seg_friction
+    full_segments = np.floor(lengths / increment).astype(int)
+    tails = lengths - full_segments * increment
+    seg_mids = (np.arange(full_segments.max(initial=0)) + 0.5) * increment
+    seg_units = np.searchsorted(tops, seg_mids, side="right") - 1
+    cum_friction = np.concatenate(
+        ([0.0], np.cumsum(skin_frictions[seg_units] * increment))
+    )
+    tail_mids = (full_segments * increment + lengths) / 2
+    tail_units = np.searchsorted(tops, tail_mids, side="right") - 1
+    friction_at_length = (
+        cum_friction[full_segments] + skin_frictions[tail_units] * tails
+    )
+    total_friction = perimeter[:, None] * friction_at_length[None, :]
 
     # End bearing
-    end_bearing = 0.0
+    end_bearing = np.zeros_like(total_friction)
     if not skin_friction_only:
-        toe_depth = length
-        toe_unit = None
-        for unit in sorted_units:
-            if unit["top_depth"] <= toe_depth < unit["bottom_depth"]:
-                toe_unit = unit
-                break
-        if not toe_unit and sorted_units:
-            toe_unit = sorted_units[-1]
-
-        if toe_unit:
-            if three_d_embed:
-                # Use the advanced 3D embedment logic
-                effective_EB = calculate_3d_embedment_eb(
-                    toe_depth, diameter, sorted_units
+        toe_units = np.searchsorted(tops, lengths, side="right") - 1
+        toe_EB = end_bearings[toe_units]
+        if three_d_embed:
+            # Use the advanced 3D embedment logic via a per-diameter lookup table
+            embed_depths = lengths - tops[toe_units]
+            units_key = tuple(
+                zip(tops.tolist(), bottoms.tolist(), end_bearings.tolist())
+            )
+            effective_EB = np.empty((diameters.size, lengths.size))
+            for i, d in enumerate(diameters):
+                partial_EB = np.array(
+                    calculate_3d_embedment_profile(float(d), units_key)
+                )
+                effective_EB[i] = np.where(
+                    embed_depths >= 3 * d, toe_EB, partial_EB[toe_units]
                 )
-            else:
-                # No 3D embedment: just use toe_unit EB
-                effective_EB = toe_unit["end_bearing"]
-            end_bearing = effective_EB * area_base
+        else:
+            # No 3D embedment: just use toe_unit EB
+            effective_EB = toe_EB[None, :]
+        end_bearing = effective_EB * area_base[:, None]
 
     total_capacity = (total_friction + end_bearing) * reduction_factor
     return total_capacity
 
 
+@st.cache_data(max_entries=32)
+def compute_grid(
+    tops,
+    skin_frictions,
+    end_bearings,
+    diameters,
+    lengths,
+    reduction_factor,
+    three_d_embed,
+    skin_friction_only,
+):
+    """
+    Cached capacity grid (in kN) of shape (len(diameters), len(lengths)).
+    Reruns with unchanged units and parameters skip the calculation.
+    """
+    return calculate_capacity(
+        diameters=diameters,
+        lengths=lengths,
+        prepared_units=prepare_units(tops, skin_frictions, end_bearings),
+        reduction_factor=reduction_factor,
+        three_d_embed=three_d_embed,
+        skin_friction_only=skin_friction_only,
+    )
+
+
 # --- Data Management Section ---
 st.sidebar.header("Data Management")
 
 # Upload CSV
 uploaded_file = st.sidebar.file_uploader("Upload CSV", type="csv")
-if uploaded_file is not None:
+# Load each uploaded file once; reloading it on every rerun would overwrite
+# later edits and keep the unit editor rerunning the app
+if (
+    uploaded_file is not None
+    and uploaded_file.file_id != st.session_state.loaded_file_id
+):
     load_csv(uploaded_file)
-    rename_units()
+    st.session_state.loaded_file_id = uploaded_file.file_id
 
 # Download CSV
-csv_data = generate_csv()
+csv_data = generate_csv(
+    params=tuple((key, st.session_state[key]) for key in PARAMETER_KEYS),
+    unit_names=tuple(st.session_state.unit_names),
+    unit_tops=st.session_state.unit_tops,
+    unit_sfs=st.session_state.unit_sfs,
+    unit_ebs=st.session_state.unit_ebs,
+)
 st.sidebar.download_button(
     label="Download CSV Template",
     data=csv_data,
@@ -350,113 +443,120 @@ st.session_state.skin_friction_only = st.sidebar.checkbox(
 # --- Geological Units Section ---
 st.sidebar.subheader("Geological Units")
 
-remove_unit_index = None
-for i, unit in enumerate(st.session_state.units):
-    with st.sidebar.expander(f"{unit['name']}", expanded=True):
-        # Unit Name
-        unit_name = st.text_input(
-            f"Name of Unit {i+1}", value=unit["name"], key=f"name_{i}"
-        )
-        # Top Depth
-        top_depth = st.number_input(
-            f"Top Depth (m) - {unit_name}",
-            min_value=0.0,
-            value=unit["top_depth"],
-            step=0.1,
-            key=f"top_depth_{i}",
-        )
-        # Skin Friction
-        skin_friction = st.number_input(
-            f"Skin Friction (kPa) - {unit_name}",
-            min_value=0.0,
-            value=unit["skin_friction"],
-            step=1.0,
-            key=f"skin_friction_{i}",
-        )
-        # End Bearing
-        end_bearing = st.number_input(
-            f"End Bearing (kPa) - {unit_name}",
-            min_value=0.0,
-            value=unit["end_bearing"],
-            step=1.0,
-            key=f"end_bearing_{i}",
-        )
 
-        # Update the unit in session_state
-        st.session_state.units[i]["name"] = unit_name
-        st.session_state.units[i]["top_depth"] = top_depth
-        st.session_state.units[i]["skin_friction"] = skin_friction
-        st.session_state.units[i]["end_bearing"] = end_bearing
-
-        # Remove Unit Button
-        if len(st.session_state.units) > 1:
-            if st.button(f"Remove {unit_name}", key=f"remove_unit_{i}"):
-                remove_unit_index = i
-
-# Handle Remove Unit
-if remove_unit_index is not None:
-    st.session_state.units.pop(remove_unit_index)
-    rename_units()
-
-# Add Unit Button
-if st.sidebar.button("Add Unit"):
-    last_top = st.session_state.units[-1]["top_depth"]
-    st.session_state.units.append(
-        {
-            "name": f"Unit {len(st.session_state.units)+1}",
-            "top_depth": last_top + 10.0,
-            "skin_friction": 0.0,
-            "end_bearing": 0.0,
-        }
+@st.fragment
+def render_units():
+    """
+    Render the geological unit editor. Editing a unit only reruns this
+    fragment; the full app reruns only when the units change.
+    """
+    units_before = units_fingerprint()
+    if "units_warning" in st.session_state:
+        st.warning(st.session_state.pop("units_warning"))
+
+    # One editor for all units; rows are added and removed in the table
+    editor_key = f"units_editor_{st.session_state.units_editor_version}"
+    edited = st.data_editor(
+        st.session_state.units_df,
+        key=editor_key,
+        num_rows="dynamic",
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            "name": st.column_config.TextColumn("Name"),
+            "top_depth": st.column_config.NumberColumn(
+                "Top Depth (m)", min_value=0.0, step=0.1
+            ),
+            "skin_friction": st.column_config.NumberColumn(
+                "Skin Friction (kPa)", min_value=0.0, step=1.0, default=0.0
+            ),
+            "end_bearing": st.column_config.NumberColumn(
+                "End Bearing (kPa)", min_value=0.0, step=1.0, default=0.0
+            ),
+        },
     )
-    rename_units()
+
+    # Keep at least one unit: put the removed rows back in a fresh editor
+    if edited.empty:
+        reset_units_editor()
+        st.session_state.units_warning = "At least one geological unit is required."
+        st.rerun()
+
+    # New rows without a top depth start 10 m below the unit above
+    tops = edited["top_depth"].to_numpy(dtype=float)
+    missing_tops = np.flatnonzero(np.isnan(tops))
+    for i in missing_tops:
+        tops[i] = tops[i - 1] + 10.0 if i else 0.0
+
+    # Update the units in session_state
+    st.session_state.unit_names = [
+        name if isinstance(name, str) and name else f"Unit {i}"
+        for i, name in enumerate(edited["name"], start=1)
+    ]
+    st.session_state.unit_tops = tops
+    st.session_state.unit_sfs = (
+        edited["skin_friction"].fillna(0.0).to_numpy(dtype=float)
+    )
+    st.session_state.unit_ebs = edited["end_bearing"].fillna(0.0).to_numpy(dtype=float)
+
+    # Renumber the units after a removal and show the filled in top depths
+    deleted_rows = st.session_state[editor_key]["deleted_rows"]
+    if deleted_rows:
+        rename_units()
+    if deleted_rows or len(missing_tops):
+        reset_units_editor()
+
+    if units_fingerprint() != units_before:
+        st.rerun()
+
+
+with st.sidebar:
+    render_units()
 
 # --- Main Content ---
 st.title("Pile Capacity Calculator")
 
-# Extract parameters
-diameters = np.arange(
-    st.session_state.diameter_min, st.session_state.diameter_max + 0.0001, 0.3
-)
-lengths = np.arange(
-    st.session_state.length_min, st.session_state.length_max + 0.0001, 2
-)
-
-units = st.session_state.units
+# Extract parameters (read session state once per rerun)
+state = st.session_state
+diameters = np.arange(state.diameter_min, state.diameter_max + 0.0001, 0.3)
+lengths = np.arange(state.length_min, state.length_max + 0.0001, 2)
+reduction_factor = state.reduction_factor
+three_d_embed = state.three_d_embed
+skin_friction_only = state.skin_friction_only
+# The unit editor replaces the arrays, so rebind them here
+unit_tops = state.unit_tops
+unit_sfs = state.unit_sfs
+unit_ebs = state.unit_ebs
 
 # Generate the plot
 with st.spinner("Calculating..."):
-    time.sleep(1)  # Simulate processing delay
-    fig = go.Figure()
-
-    for d in diameters:
-        capacities = []
-        for L in lengths:
-            cap = calculate_capacity(
-                diameter=d,
-                length=L,
-                units=units,
-                reduction_factor=st.session_state.reduction_factor,
-                three_d_embed=st.session_state.three_d_embed,
-                skin_friction_only=st.session_state.skin_friction_only,
-            )
-            capacities.append(cap)
-
-        fig.add_trace(
-            go.Scatter(
-                x=capacities, y=lengths, mode="lines+markers", name=f"D={d:.1f}m"
-            )
-        )
+    capacities = compute_grid(
+        tops=unit_tops,
+        skin_frictions=unit_sfs,
+        end_bearings=unit_ebs,
+        diameters=diameters,
+        lengths=lengths,
+        reduction_factor=reduction_factor,
+        three_d_embed=three_d_embed,
+        skin_friction_only=skin_friction_only,
+    )
 
-    # Invert the y-axis and increase height
-    fig.update_yaxes(autorange="reversed", title_text="Pile Length (m)")
-    fig.update_xaxes(title_text="Total Capacity (kN)")
-    fig.update_layout(
-        title="Pile Capacity vs Pile Length",
-        legend_title_text="Diameter (m)",
-        hovermode="x unified",
-        template="plotly_white",
-        height=1000,  # Double the typical height
+    traces = [
+        go.Scatter(x=row, y=lengths, mode="lines+markers", name=f"D={d:.1f}m")
+        for d, row in zip(diameters, capacities)
+    ]
+    fig = go.Figure(
+        data=traces,
+        layout=go.Layout(
+            title="Pile Capacity vs Pile Length",
+            # Invert the y-axis and increase height
+            yaxis=dict(autorange="reversed", title_text="Pile Length (m)"),
+            xaxis=dict(title_text="Total Capacity (kN)"),
+            legend_title_text="Diameter (m)",
+            hovermode="x unified",
+            template="plotly_white",
+            height=1000,  # Double the typical height
+        ),
     )
 
     st.plotly_chart(fig, use_container_width=True)